@@ -1,16 +1,19 @@
 
-from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI
+from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
 from scapy.all import *
+import sys
 import threading
+import time
 import uvicorn
+from packet_filter import (
+    PROTOCOL_MATCHES, accumulate_counts, build_filter, enable_promisc, open_counting_socket,
+)
 
 app = FastAPI()
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
-templates = Jinja2Templates(directory="templates")
 
 # Dictionary to store protocol counts
 protocol_counts = {
@@ -20,8 +23,24 @@ protocol_counts = {
     'OTHER': 0
 }
 
+def kernel_packet_counter():
+    # The kernel classifies and counts every packet; Python only reads the totals
+    iface = conf.iface.name if hasattr(conf.iface, 'name') else conf.iface
+    sockets = {name: open_counting_socket(iface, build_filter(matches))
+               for name, matches in PROTOCOL_MATCHES.items()}
+    all_packets = open_counting_socket(iface)
+    if conf.sniff_promisc:
+        enable_promisc(all_packets, iface)
+    total = 0
+    while True:
+        time.sleep(1)
+        total = accumulate_counts(protocol_counts, sockets, all_packets, total)
+
 def packet_sniffer():
-    sniff(prn=process_packet, store=0)
+    if sys.platform.startswith('linux'):
+        kernel_packet_counter()
+    else:
+        sniff(prn=process_packet, store=0)
 
 def process_packet(packet):
     if packet.haslayer(TCP):
@@ -33,16 +52,19 @@ def process_packet(packet):
     else:
         protocol_counts['OTHER'] += 1
 
-@app.get("/", response_class=HTMLResponse)
-async def read_root(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request})
+@app.get("/", response_class=FileResponse)
+async def read_root():
+    # index.html has no template variables, so send it as-is instead of rendering it
+    return FileResponse("templates/index.html")
 
 @app.get("/data")
-async def get_data():
+async def get_data() -> dict[str, int]:
+    # The declared return type lets FastAPI serialize through Pydantic straight to bytes
     return protocol_counts
 
 if __name__ == '__main__':
     sniffer_thread = threading.Thread(target=packet_sniffer)
     sniffer_thread.daemon = True
     sniffer_thread.start()
-    uvicorn.run(app, host="127.0.0.1", port=5000)
+    # The frontend polls /data every second; skip the per-request access log line
+    uvicorn.run(app, host="127.0.0.1", port=5000, access_log=False)
@@ -0,0 +1,96 @@
+import ctypes
+import socket
+import struct
+
+# Linux packet socket and classic BPF constants (see linux/if_packet.h, linux/filter.h)
+SOL_PACKET = 263
+PACKET_STATISTICS = 6
+SO_ATTACH_FILTER = 26
+PACKET_ADD_MEMBERSHIP = 1
+PACKET_MR_PROMISC = 1
+ETH_P_ALL = 0x0003
+ETH_P_IP = 0x0800
+ETH_P_IPV6 = 0x86DD
+BPF_LDH_ABS = 0x28
+BPF_LDB_ABS = 0x30
+BPF_JEQ_K = 0x15
+BPF_RET_K = 0x06
+SKF_AD_PROTOCOL = 0xFFFFF000  # SKF_AD_OFF + SKF_AD_PROTOCOL, the packet's ethertype
+
+# (ethertype, offset of the protocol byte in the network header, protocol number)
+# for each counted protocol; ICMP is IPv4 only, as with scapy's ICMP layer
+PROTOCOL_MATCHES = {
+    'TCP': [(ETH_P_IP, 9, 6), (ETH_P_IPV6, 6, 6)],
+    'UDP': [(ETH_P_IP, 9, 17), (ETH_P_IPV6, 6, 17)],
+    'ICMP': [(ETH_P_IP, 9, 1)],
+}
+
+# Filter layout: one MATCH_BLOCK_LEN-instruction block per match, then REJECT, then ACCEPT.
+#   +0  A = ethertype
+#   +1  if A == ethertype goto +2 else goto next block (or REJECT after the last one)
+#   +2  A = protocol byte
+#   +3  if A == proto goto ACCEPT else fall through to the next block (or REJECT)
+# BPF jump offsets are relative to the instruction after the jump.
+MATCH_BLOCK_LEN = 4
+ETHERTYPE_MISS_JUMP = MATCH_BLOCK_LEN - 2
+
+def build_filter(matches):
+    program = []
+    reject = len(matches) * MATCH_BLOCK_LEN
+    accept = reject + 1
+    for i, (ethertype, offset, proto) in enumerate(matches):
+        proto_jump = i * MATCH_BLOCK_LEN + 3
+        program += [
+            (BPF_LDH_ABS, 0, 0, SKF_AD_PROTOCOL),
+            (BPF_JEQ_K, 0, ETHERTYPE_MISS_JUMP, ethertype),
+            (BPF_LDB_ABS, 0, 0, offset),
+            (BPF_JEQ_K, accept - proto_jump - 1, 0, proto),
+        ]
+    program += [(BPF_RET_K, 0, 0, 0), (BPF_RET_K, 0, 0, 1)]
+    return program
+
+def pack_filter(program):
+    # Returns the struct sock_fprog bytes and the instruction buffer it points to;
+    # the buffer must stay alive until the setsockopt call has copied it
+    code = ctypes.create_string_buffer(b''.join(struct.pack('HBBI', *ins) for ins in program))
+    return struct.pack('HP', len(program), ctypes.addressof(code)), code
+
+def read_packet_count(sock):
+    # tp_packets already includes tp_drops, and the kernel resets both on read
+    packets, _ = struct.unpack('II', sock.getsockopt(SOL_PACKET, PACKET_STATISTICS, 8))
+    return packets
+
+def pack_promisc_membership(ifindex):
+    # struct packet_mreq: ifindex, type, address length and an unused 8-byte address
+    return struct.pack('iHH8s', ifindex, PACKET_MR_PROMISC, 0, b'')
+
+def enable_promisc(sock, iface):
+    # Like scapy's set_promisc; the interface stays promiscuous while the socket is open,
+    # so the filtered sockets on the same interface see the extra frames too
+    membership = pack_promisc_membership(socket.if_nametoindex(iface))
+    sock.setsockopt(SOL_PACKET, PACKET_ADD_MEMBERSHIP, membership)
+
+def open_counting_socket(iface, program=None):
+    sock = socket.socket(socket.AF_PACKET, socket.SOCK_DGRAM, socket.htons(ETH_P_ALL))
+    # Only count the interface scapy's sniff() would have listened on
+    sock.bind((iface, ETH_P_ALL))
+    # Packets are never read; once the tiny queue is full the kernel drops them,
+    # and dropped packets are still included in PACKET_STATISTICS
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 0)
+    if program is not None:
+        fprog, code = pack_filter(program)
+        sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
+    # Discard whatever was counted before the bind and filter were in place
+    read_packet_count(sock)
+    return sock
+
+def accumulate_counts(counts, sockets, all_packets, total):
+    # Read every socket back to back before touching the shared counts
+    packets = {name: read_packet_count(sock) for name, sock in sockets.items()}
+    total += read_packet_count(all_packets)
+    for name in packets:
+        counts[name] += packets[name]
+    # A protocol packet arriving between the reads is in total a tick before its
+    # protocol count; clamp so OTHER never goes down when the protocol catches up
+    counts['OTHER'] = max(counts['OTHER'], total - sum(counts[name] for name in sockets))
+    return total
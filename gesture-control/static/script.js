@@ -33,10 +33,8 @@ const protocolChart = new Chart(ctx, {
 });
 
 async function fetchData() {
-    console.log("Fetching data...");
     const response = await fetch('/data');
     const data = await response.json();
-    console.log("Data received:", data);
     protocolChart.data.labels = Object.keys(data);
     protocolChart.data.datasets[0].data = Object.values(data);
     protocolChart.update();
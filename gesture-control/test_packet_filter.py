@@ -0,0 +1,190 @@
+import struct
+import unittest
+
+from packet_filter import (
+    BPF_JEQ_K, BPF_LDB_ABS, BPF_LDH_ABS, BPF_RET_K, ETH_P_IP, ETH_P_IPV6,
+    MATCH_BLOCK_LEN, PACKET_MR_PROMISC, PACKET_STATISTICS, PROTOCOL_MATCHES, SKF_AD_PROTOCOL,
+    SOL_PACKET, accumulate_counts, build_filter, pack_filter, pack_promisc_membership,
+    read_packet_count,
+)
+
+REJECT = (BPF_RET_K, 0, 0, 0)
+ACCEPT = (BPF_RET_K, 0, 0, 1)
+
+
+def run_filter(program, ethertype, network_header):
+    # Minimal interpreter for the instructions build_filter emits
+    pc = 0
+    a = 0
+    while True:
+        code, jt, jf, k = program[pc]
+        if code == BPF_RET_K:
+            return k
+        if code == BPF_LDH_ABS and k == SKF_AD_PROTOCOL:
+            a = ethertype
+        elif code == BPF_LDB_ABS:
+            a = network_header[k]
+        elif code == BPF_JEQ_K:
+            pc += jt if a == k else jf
+        else:
+            raise AssertionError('unexpected instruction %r' % (program[pc],))
+        pc += 1
+
+
+def ipv4_header(proto):
+    header = bytearray(20)
+    header[9] = proto
+    return bytes(header)
+
+
+def ipv6_header(next_header):
+    header = bytearray(40)
+    header[6] = next_header
+    return bytes(header)
+
+
+class BuildFilterTest(unittest.TestCase):
+
+    def test_single_match(self):
+        self.assertEqual(build_filter([(ETH_P_IP, 9, 1)]), [
+            (BPF_LDH_ABS, 0, 0, SKF_AD_PROTOCOL),
+            (BPF_JEQ_K, 0, 2, ETH_P_IP),
+            (BPF_LDB_ABS, 0, 0, 9),
+            (BPF_JEQ_K, 1, 0, 1),
+            REJECT,
+            ACCEPT,
+        ])
+
+    def test_two_matches(self):
+        self.assertEqual(build_filter([(ETH_P_IP, 9, 6), (ETH_P_IPV6, 6, 6)]), [
+            (BPF_LDH_ABS, 0, 0, SKF_AD_PROTOCOL),
+            (BPF_JEQ_K, 0, 2, ETH_P_IP),
+            (BPF_LDB_ABS, 0, 0, 9),
+            (BPF_JEQ_K, 5, 0, 6),
+            (BPF_LDH_ABS, 0, 0, SKF_AD_PROTOCOL),
+            (BPF_JEQ_K, 0, 2, ETH_P_IPV6),
+            (BPF_LDB_ABS, 0, 0, 6),
+            (BPF_JEQ_K, 1, 0, 6),
+            REJECT,
+            ACCEPT,
+        ])
+
+    def test_jump_targets(self):
+        for count in (1, 2, 3):
+            matches = [(ETH_P_IP, 9, proto) for proto in range(1, count + 1)]
+            program = build_filter(matches)
+            reject, accept = len(program) - 2, len(program) - 1
+            self.assertEqual(program[reject], REJECT)
+            self.assertEqual(program[accept], ACCEPT)
+            for block in range(count):
+                start = block * MATCH_BLOCK_LEN
+                next_block = start + MATCH_BLOCK_LEN
+                ethertype_jump = program[start + 1]
+                proto_jump = program[start + 3]
+                # An ethertype or protocol miss goes to the next block, or REJECT after the last
+                self.assertEqual(start + 2 + ethertype_jump[2], next_block)
+                self.assertEqual(start + 4 + proto_jump[2], next_block)
+                # A protocol hit always goes to ACCEPT
+                self.assertEqual(start + 4 + proto_jump[1], accept)
+
+    def test_protocol_filters(self):
+        packets = {
+            'TCP': [(ETH_P_IP, ipv4_header(6)), (ETH_P_IPV6, ipv6_header(6))],
+            'UDP': [(ETH_P_IP, ipv4_header(17)), (ETH_P_IPV6, ipv6_header(17))],
+            'ICMP': [(ETH_P_IP, ipv4_header(1))],
+        }
+        others = [(ETH_P_IPV6, ipv6_header(58)), (ETH_P_IP, ipv4_header(253)), (0x0806, bytes(28))]
+        for name, matches in PROTOCOL_MATCHES.items():
+            program = build_filter(matches)
+            for other_name, samples in packets.items():
+                for ethertype, header in samples:
+                    expected = 1 if other_name == name else 0
+                    self.assertEqual(run_filter(program, ethertype, header), expected)
+            for ethertype, header in others:
+                self.assertEqual(run_filter(program, ethertype, header), 0)
+
+
+class PackFilterTest(unittest.TestCase):
+
+    def test_instructions_are_eight_bytes(self):
+        program = build_filter(PROTOCOL_MATCHES['TCP'])
+        fprog, code = pack_filter(program)
+        self.assertEqual(len(code.raw), len(program) * 8 + 1)  # plus ctypes' trailing NUL
+
+    def test_sock_fprog_layout(self):
+        program = build_filter(PROTOCOL_MATCHES['TCP'])
+        fprog, code = pack_filter(program)
+        if struct.calcsize('P') == 8:
+            self.assertEqual(len(fprog), 16)
+        length, _ = struct.unpack('HP', fprog)
+        self.assertEqual(length, len(program))
+        self.assertEqual(struct.unpack_from('HBBI', code.raw, 0), program[0])
+
+    def test_promisc_membership_layout(self):
+        membership = pack_promisc_membership(3)
+        self.assertEqual(len(membership), 16)
+        self.assertEqual(struct.unpack('iHH8s', membership), (3, PACKET_MR_PROMISC, 0, bytes(8)))
+
+
+class FakeStatsSocket:
+    # Mimics PACKET_STATISTICS: tp_packets includes drops, and reading resets both
+
+    def __init__(self):
+        self.packets = 0
+        self.drops = 0
+
+    def receive(self, queued, dropped=0):
+        self.packets += queued
+        self.drops += dropped
+
+    def getsockopt(self, level, option, length):
+        assert (level, option, length) == (SOL_PACKET, PACKET_STATISTICS, 8)
+        stats = struct.pack('II', self.packets + self.drops, self.drops)
+        self.packets = self.drops = 0
+        return stats
+
+
+class CountingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sockets = {name: FakeStatsSocket() for name in PROTOCOL_MATCHES}
+        self.all_packets = FakeStatsSocket()
+        self.counts = {'TCP': 0, 'UDP': 0, 'ICMP': 0, 'OTHER': 0}
+
+    def test_read_packet_count_includes_drops_and_resets(self):
+        sock = FakeStatsSocket()
+        sock.receive(3, dropped=7)
+        self.assertEqual(read_packet_count(sock), 10)
+        self.assertEqual(read_packet_count(sock), 0)
+
+    def test_accumulate_counts(self):
+        self.sockets['TCP'].receive(2, dropped=3)
+        self.sockets['UDP'].receive(4)
+        self.sockets['ICMP'].receive(1)
+        self.all_packets.receive(2, dropped=10)
+        total = accumulate_counts(self.counts, self.sockets, self.all_packets, 0)
+        self.assertEqual(total, 12)
+        self.assertEqual(self.counts, {'TCP': 5, 'UDP': 4, 'ICMP': 1, 'OTHER': 2})
+
+        self.sockets['UDP'].receive(1)
+        self.all_packets.receive(3)
+        total = accumulate_counts(self.counts, self.sockets, self.all_packets, total)
+        self.assertEqual(total, 15)
+        self.assertEqual(self.counts, {'TCP': 5, 'UDP': 5, 'ICMP': 1, 'OTHER': 4})
+
+    def test_other_never_decreases(self):
+        # A TCP packet lands in the total one tick before the TCP socket is read
+        self.all_packets.receive(1)
+        total = accumulate_counts(self.counts, self.sockets, self.all_packets, 0)
+        self.assertEqual(self.counts['OTHER'], 1)
+        self.sockets['TCP'].receive(1)
+        total = accumulate_counts(self.counts, self.sockets, self.all_packets, total)
+        self.assertEqual(self.counts, {'TCP': 1, 'UDP': 0, 'ICMP': 0, 'OTHER': 1})
+        # Later OTHER traffic catches up with the clamped value rather than adding to it
+        self.all_packets.receive(2)
+        accumulate_counts(self.counts, self.sockets, self.all_packets, total)
+        self.assertEqual(self.counts['OTHER'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()